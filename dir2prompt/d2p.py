@@ -1,128 +1,429 @@
+import io
 import os
+import re
+import mmap
 import json
+import atexit
+import codecs
+import pickle
 import fnmatch
 import argparse
+import functools
+import concurrent.futures
 from importlib.resources import files
 
+# use orjson's C-accelerated parser for notebook JSON when available (2-5x faster
+# on large notebooks); fall back to the stdlib parser otherwise
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# use ijson's streaming parser for notebooks when available: only cell_type and
+# source are materialized, so cell outputs (often 90%+ of a notebook with base64
+# images) are never built into Python objects at all
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# use RE2 for ignore-pattern matching when available: it compiles the alternation
+# to a DFA with linear-time matching no matter how many patterns users pile on;
+# fall back to the stdlib backtracking engine otherwise
+try:
+    import re2 as _re
+except ImportError:
+    _re = re
+
+
+# on-disk cache of rendered notebooks keyed by path -> (mtime_ns, size, rendered string),
+# so repeated d2p runs skip JSON parsing for unchanged notebooks
+_notebook_cache_path = os.path.expanduser("~/.cache/d2p/notebooks.pkl")
+_notebook_cache_size = 1000
+
+# files above this size are streamed in chunks rather than read in one allocation
+_large_file_threshold = 1_000_000
+_notebook_cache = None
+_notebook_cache_dirty = False
+
+
+def _load_notebook_cache() -> dict:
+    """Load the notebook cache from disk on first use, registering a save-on-exit hook"""
+    global _notebook_cache
+    if _notebook_cache is None:
+        try:
+            with open(_notebook_cache_path, "rb") as f:
+                _notebook_cache = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            _notebook_cache = {}
+        atexit.register(_save_notebook_cache)
+    return _notebook_cache
+
+
+def _save_notebook_cache():
+    """Write the notebook cache back to disk atomically (write to a temp file, then rename)"""
+    if not _notebook_cache_dirty:
+        return
+    try:
+        os.makedirs(os.path.dirname(_notebook_cache_path), exist_ok=True)
+        tmp_path = f"{_notebook_cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(_notebook_cache, f)
+        os.replace(tmp_path, _notebook_cache_path)
+    except OSError:
+        # the cache is best-effort -- never fail a run over it
+        pass
 
-def build_directory_tree(
+
+@functools.lru_cache(maxsize=1)
+def default_config_path() -> str:
+    """Resolve the packaged config.json path once -- importlib.resources walks package metadata on every call"""
+    return str(files("dir2prompt").joinpath("config.json"))
+
+
+def compile_ignore_patterns(patterns: list[str]) -> "re.Pattern | None":
+    """Compile a list of glob patterns into a single alternation regex, or None if the list is empty"""
+    if not patterns:
+        return None
+    # strip fnmatch.translate's trailing \Z from each branch and anchor the whole
+    # alternation once, with every branch non-capturing
+    branches = "|".join(f"(?:{fnmatch.translate(pattern)[:-2]})" for pattern in patterns)
+    return _re.compile(f"^(?:{branches})$")
+
+
+def iter_directory_tree(
         dir: str = ".",
-        path: str = "",
-        level: int = 0,
-        file_paths: list[str] = [],
-        IGNORE_DIRS: list[str] = [],
-        IGNORE_FILES: list[str] = [],
-    ) -> tuple[str, list[str]]:
-    """Build a tree representation of a directory and return a list of file paths under the root directory"""
-    tree_str = ""
-
-    if level == 0:
-        # add the base directory name to the tree string
-        tree_str += f"{os.path.basename(os.getcwd() if dir == '.' else dir)}/\n"
-
-    # NOTE: this currently includes files to be ignored in tree string -- these should maybe be excluded as well
-    # get all contents of the dir, ignoring dirs like build, target, etc. to save on token count for final tree string
-    # using fnmatch to allow for wildcard patterns in IGNORE_DIRS
-    items = [
-        item
-        for item in sorted(os.listdir(dir))
-        if not any(fnmatch.fnmatch(item, pattern) for pattern in IGNORE_DIRS)
-    ]
-
-    for i, item in enumerate(items):
-        item_path = os.path.join(dir, item)
-
-        # the last item in the list (contents of curr dir) has not more items printed below it
-        is_last_item = i == len(items) - 1
+        ignore_dir_re: "re.Pattern | None" = None,
+        ignore_file_re: "re.Pattern | None" = None,
+        base_name: "str | None" = None,
+    ):
+    """Walk a directory once, yielding ("tree", line) events for the tree rendering and ("file", (path, size, inode)) events for each included file"""
+    # add the base directory name to the tree string (callers that already know it
+    # can pass it in and skip the getcwd syscall)
+    if base_name is None:
+        base_name = os.path.basename(os.getcwd() if dir == "." else dir)
+    yield "tree", f"{base_name}/\n"
+
+    # iterative depth-first traversal with an explicit stack instead of recursion:
+    # no Python frame per directory, and each dirent is touched exactly once --
+    # its tree line and its file event come out of the same visit.
+    #
+    # deliberately not os.walk: it prunes and walks the same way this does (it is
+    # scandir-based with topdown dirnames pruning), but it only surfaces name
+    # lists, so the per-file size and inode would each cost an extra stat() that
+    # the DirEntry objects here provide for free, and its per-directory grouping
+    # would require buffering and reordering to interleave tree lines correctly
+    stack = []
+    # relative paths are built with a plain f-string -- os.path.join costs ~500 ns of
+    # fspath dispatch and normalization per call, which adds up in this loop
+    sep = os.sep
+
+    # since symlinked directories are followed, keep the (st_dev, st_ino) of every
+    # directory on the current ancestor chain and refuse to descend into one that is
+    # already there: a link cycle terminates (its line still renders, the repeating
+    # subtree is just not re-entered) while a harmless duplicate link elsewhere in
+    # the tree is still walked, exactly as the recursive isdir walk did. this costs
+    # one stat per directory, not per entry
+    root_st = os.stat(dir)
+    on_chain = {(root_st.st_dev, root_st.st_ino)}
+
+    def push_dir(dir_path: str, rel_path: str, level: int):
+        # NOTE: this currently includes files to be ignored in tree string -- these should maybe be excluded as well
+        # get all contents of the dir, ignoring dirs like build, target, etc. to save on token count for final tree string
+        # the IGNORE_DIRS glob patterns are precompiled into a single regex so each entry
+        # costs one C-level match instead of re-translating every pattern via fnmatch
+        # os.scandir returns DirEntry objects whose is_dir() reuses the type info from the
+        # directory listing itself, avoiding the extra stat() syscall per entry that
+        # os.path.isdir would cost
+        #
+        # pruning happens here, in the parent's listing, before an entry is ever pushed:
+        # an ignored directory (node_modules, .git, ...) is dropped by name and its
+        # subtree is never opened with scandir at all; symlinked directories are
+        # followed like any other directory, as os.path.isdir classified them, with
+        # the visited set below keeping a link cycle from walking forever
+        with os.scandir(dir_path) as it:
+            if ignore_dir_re is not None:
+                kept = (entry for entry in it if ignore_dir_re.match(entry.name) is None)
+            else:
+                kept = it
+            entries = sorted(kept, key=lambda e: e.name)
+        # push in reverse so entries pop off the stack in sorted order, with each
+        # subtree emitted directly below its directory's line
+        for i, entry in enumerate(reversed(entries)):
+            # the last item in the list (contents of curr dir) has no more items printed below it
+            is_last_item = i == 0
+            stack.append((entry, rel_path, level, is_last_item))
+
+    push_dir(dir, "", 0)
+    while stack:
+        entry, rel_path, level, is_last_item = stack.pop()
+        if entry is None:
+            # exit marker: this directory's subtree is fully walked, so its
+            # identity leaves the ancestor chain (rel_path carries the key here)
+            on_chain.discard(rel_path)
+            continue
+        item = entry.name
+        # follow symlinks so a link to a directory is walked as a directory (and a
+        # link to a file is read as a file); a broken or looping link is treated as
+        # a file, so the read warns and skips it instead of aborting the walk
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+
         if is_last_item:
-            prefix = "└── " 
+            prefix = "└── "
         else:
-            prefix = "├── " 
+            prefix = "├── "
 
         # when printing contents nested in child dirs, we need to make sure to print the
         # vertical bars to the left of these contents that connect the contents of the parent dir
-        if level > 0:
-            tree_str += "│   " * (level - 1)
-            tree_str += "│   "
-        # print(f"{'│   ' * level}{item} ({level})")
+        bars = "│   " * level if level > 0 else ""
 
-        # now add the item to the tree string and move to the next line for the next item
-        if os.path.isdir(item_path):
+        # now yield the item's tree line and move on to the next item
+        if is_dir:
             item += "/"
-        tree_str += prefix + item + "\n"
-
-        if os.path.isdir(item_path):
-            # follow the directory down to the next level of the tree
-            tree_str_child, file_paths = build_directory_tree(
-                item_path,
-                path=os.path.join(path, item),
-                level=level + 1,
-                file_paths=file_paths,
-                IGNORE_DIRS=IGNORE_DIRS,
-                IGNORE_FILES=IGNORE_FILES,
-            )
-            tree_str += tree_str_child
+        yield "tree", f"{bars}{prefix}{item}\n"
+
+        if is_dir:
+            # follow the directory down to the next level of the tree, unless it is
+            # one of its own ancestors (a symlink cycle); the exit marker goes on
+            # the stack first so it pops only after the whole subtree is walked
+            dir_st = entry.stat()
+            dir_key = (dir_st.st_dev, dir_st.st_ino)
+            if dir_key not in on_chain:
+                on_chain.add(dir_key)
+                stack.append((None, dir_key, 0, False))
+                push_dir(entry.path, f"{rel_path}{sep}{entry.name}" if rel_path else entry.name, level + 1)
         else:
-            # add file path to list if allowed file
-            if not any(fnmatch.fnmatch(item, pattern) for pattern in IGNORE_FILES):
-                file_paths.append(os.path.join(path, item))
+            # yield the file if allowed, along with its size from the DirEntry stat
+            # (so readers can allocate exact-size buffers later) and its inode from
+            # the directory listing (so reads can be ordered by physical disk layout).
+            # the stat follows symlinks, matching the read that opens the path -- an
+            # lstat would report the link's own length and truncate the content; for
+            # a broken link the stat fails, so report size 0 and let the read warn
+            if ignore_file_re is None or ignore_file_re.match(item) is None:
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    size = 0
+                yield "file", (f"{rel_path}{sep}{item}" if rel_path else item, size, entry.inode())
+
 
-    return tree_str, file_paths
+def build_directory_tree(
+        dir: str = ".",
+        ignore_dir_re: "re.Pattern | None" = None,
+        ignore_file_re: "re.Pattern | None" = None,
+        base_name: "str | None" = None,
+    ) -> tuple[str, list[tuple[str, int, int]]]:
+    """Build a tree representation of a directory and return a list of (file path, size, inode) triples under the root directory"""
+    # thin wrapper over iter_directory_tree for callers that want the materialized pair
+    buf = io.StringIO()
+    file_paths = []
+    for kind, payload in iter_directory_tree(dir, ignore_dir_re=ignore_dir_re, ignore_file_re=ignore_file_re, base_name=base_name):
+        if kind == "tree":
+            buf.write(payload)
+        else:
+            file_paths.append(payload)
+    return buf.getvalue(), file_paths
 
 
 def read_notebook(file: str) -> str:
     """Read the contents of a Jupyter notebook file (.ipynb) and return a string representation of the cells"""
-    with open(file, "r") as f:
-        notebook = json.load(f)
-        cell_content = ["".join(cell["source"]) for cell in notebook["cells"]]
-        cell_types = [cell["cell_type"] for cell in notebook["cells"]]
-    
-    notebook_str = ""
-    for i, cell in enumerate(cell_content):
-        notebook_str += f"{'-'*10} Cell {i+1} ({cell_types[i]}) {'-'*10}\n"
-        notebook_str += cell + "\n\n"
+    global _notebook_cache_dirty
+
+    # return the cached rendering if the notebook is unchanged since it was last parsed
+    st = os.stat(file)
+    cache = _load_notebook_cache()
+    cached = cache.get(file)
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        # re-insert to mark the entry as recently used (dicts keep insertion order)
+        cache.pop(file, None)
+        cache[file] = cached
+        return cached[2]
+
+    buf = io.StringIO()
+    if ijson is not None:
+        # stream the JSON and keep only each cell's type and source, flushing a cell
+        # when its object closes; outputs and metadata stream past without ever being
+        # materialized (source can be one string or a list of strings)
+        with open(file, "rb") as f:
+            cell_num = 0
+            cell_type = ""
+            source_parts = []
+            for prefix, event, value in ijson.parse(f):
+                if prefix == "cells.item" and event == "start_map":
+                    cell_type = ""
+                    source_parts = []
+                elif prefix == "cells.item.cell_type":
+                    cell_type = value
+                elif prefix in ("cells.item.source", "cells.item.source.item") and event == "string":
+                    source_parts.append(value)
+                elif prefix == "cells.item" and event == "end_map":
+                    cell_num += 1
+                    buf.write(f"{'-'*10} Cell {cell_num} ({cell_type}) {'-'*10}\n")
+                    buf.write("".join(source_parts))
+                    buf.write("\n\n")
+    else:
+        # read bytes and parse in one shot (orjson only accepts bytes/str, not file objects)
+        with open(file, "rb") as f:
+            notebook = _json_loads(f.read())
+
+        # render in a single pass over the cells rather than building intermediate lists
+        for i, cell in enumerate(notebook["cells"]):
+            buf.write(f"{'-'*10} Cell {i+1} ({cell['cell_type']}) {'-'*10}\n")
+            buf.write("".join(cell["source"]))
+            buf.write("\n\n")
+    notebook_str = buf.getvalue()
+
+    # store the rendering, evicting the least recently used entries past the size bound
+    cache[file] = (st.st_mtime_ns, st.st_size, notebook_str)
+    while len(cache) > _notebook_cache_size:
+        del cache[next(iter(cache))]
+    _notebook_cache_dirty = True
     return notebook_str
     
 
 def build_prompt(
-        dir: str = ".", 
-        filters: list[str] = None, 
-        IGNORE_DIRS: list[str] = [], 
-        IGNORE_FILES: list[str] = []
-    ) -> str:
-    """Build a prompt for a directory, including a tree representation of the directory and the contents of each file in the directory that matches the filters"""
-    tree_str, file_paths = build_directory_tree(dir=dir, IGNORE_DIRS=IGNORE_DIRS, IGNORE_FILES=IGNORE_FILES)
-    prompt = f"<context>\n"
-    prompt += f"<directory_tree>\n{tree_str}</directory_tree>\n\n"
-
-    prompt += "<files>\n\n"
-    for file in file_paths:
-        # read only filtered files, if specified
-        if filters is None or any(file.endswith(ext) for ext in filters):
-            filepath = os.path.join(dir, file)
-            try:
-                if file.endswith(".ipynb"):
-                    file_content = read_notebook(filepath)
-                else:
-                    with open(filepath, "r") as f:
-                        file_content = f.read()
+        dir: str = ".",
+        filters: list[str] = None,
+        IGNORE_DIRS: list[str] = [],
+        IGNORE_FILES: list[str] = [],
+        out=None,
+        base_name: "str | None" = None,
+    ) -> "bytes | None":
+    """Build a prompt for a directory, including a tree representation of the directory and the contents of each file in the directory that matches the filters
+
+    When `out` (a binary file-like object) is given, the prompt is streamed into it
+    and None is returned, so peak memory is bounded by one batch of whole-file
+    contents (up to 2x max_workers files, each fully materialized -- including
+    files on the mmap path) rather than the whole prompt; otherwise the prompt is
+    buffered and returned as bytes.
+    """
+    # compile the glob pattern lists once up front so the tree walk does a single
+    # regex match per entry instead of M fnmatch calls
+    ignore_dir_re = compile_ignore_patterns(IGNORE_DIRS)
+    ignore_file_re = compile_ignore_patterns(IGNORE_FILES)
+
+    # stream into the caller's file object when given, otherwise accumulate the
+    # UTF-8 bytes in a BytesIO buffer; either way file bytes pass straight through
+    # and nothing gets re-encoded when the prompt is saved
+    buf = io.BytesIO() if out is None else out
+    buf.write(b"<context>\n")
+    buf.write(b"<directory_tree>\n")
+
+    # consume the fused walk: tree lines are encoded and written as they are
+    # produced (the tree section precedes the files section in the output, so only
+    # the small per-file metadata is carried over to the read phase -- the full
+    # tree string is never materialized)
+    file_paths = []
+    for kind, payload in iter_directory_tree(dir=dir, ignore_dir_re=ignore_dir_re, ignore_file_re=ignore_file_re, base_name=base_name):
+        if kind == "tree":
+            buf.write(payload.encode("utf-8"))
+        else:
+            file_paths.append(payload)
+    buf.write(b"</directory_tree>\n\n")
+
+    # join the directory prefix once instead of os.path.join-ing it per file
+    dir_prefix = dir if dir.endswith(os.sep) else f"{dir}{os.sep}"
+
+    def read_one(file_info: tuple[str, int, int]) -> tuple[str, "bytes | None", "str | None"]:
+        """Read a single file off the main thread, returning (file, content bytes, error)"""
+        file, size, _inode = file_info
+        filepath = dir_prefix + file
+        try:
+            if file.endswith(".ipynb"):
+                content = read_notebook(filepath).encode("utf-8")
+            elif size > _large_file_threshold:
+                # memory-map big files and copy 64 KB windows into the per-file
+                # buffer: the kernel pages bytes in on demand instead of copying the
+                # whole file through a read buffer first; the incremental decoder
+                # only validates UTF-8 (handling characters that straddle a window
+                # boundary) -- the raw bytes are what gets buffered
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                file_buf = io.BytesIO()
+                with open(filepath, "rb") as f:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        for i in range(0, len(mm), 65536):
+                            window = mm[i:i + 65536]
+                            decoder.decode(window)
+                            file_buf.write(window)
+                decoder.decode(b"", final=True)
+                content = file_buf.getvalue()
+            else:
+                # the size is already known from the tree walk, so read the whole file
+                # with one exact-size os.read -- no TextIOWrapper and no buffer growth.
+                # the size is only a hint (the file may have changed since the walk),
+                # so keep reading until EOF rather than trusting it blindly
+                fd = os.open(filepath, os.O_RDONLY)
+                try:
+                    content = os.read(fd, size) if size else b""
+                    while True:
+                        extra = os.read(fd, 65536)
+                        if not extra:
+                            break
+                        content += extra
+                finally:
+                    os.close(fd)
+                # validate UTF-8 so binary files are still skipped with a warning
+                content.decode("utf-8")
+            # text-mode reads translated universal newlines; keep doing so
+            if b"\r" in content:
+                content = content.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            return file, content, None
+        except UnicodeDecodeError:
+            return file, None, f"Unable to decode file content due to UnicodeDecodeError: {file}"
+        except FileNotFoundError:
+            return file, None, f"File not found: {file}"
+        except OSError as e:
+            # permission errors, entries that turn out not to be regular files, etc.
+            # -- warn and skip rather than aborting the whole run
+            return file, None, f"Unable to read file ({e.strerror}): {file}"
+
+    # read only filtered files, if specified -- str.endswith accepts a tuple of
+    # suffixes and runs the comparison loop in C, so no per-file any() generator
+    suffixes = tuple(filters) if filters is not None else None
+    files = [info for info in file_paths if suffixes is None or info[0].endswith(suffixes)]
+
+    buf.write(b"<files>\n\n")
+    # file reads are I/O-bound and release the GIL, so fan them out across a thread
+    # pool. files are processed in tree-order batches (bounded, unlike executor.map,
+    # which submits everything at once, so at most one batch of contents is held in
+    # memory); within each batch reads are issued in inode order, which follows the
+    # physical disk layout and cuts seek time on cold caches, and results are mapped
+    # back to tree order before serializing so the output is unchanged
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    batch_size = max_workers * 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(files), batch_size):
+            batch = files[start:start + batch_size]
+            by_inode = sorted(batch, key=lambda info: info[2])
+            results = {file: (content, error) for file, content, error in executor.map(read_one, by_inode)}
+
+            for file, _size, _inode in batch:
+                file_content, error = results[file]
+                if error is not None:
+                    print(error)
+                    continue
 
                 # add file string to prompt
-                prompt += f"<file>\n"
-                prompt += f"<path>{file}</path>\n"
+                buf.write(b"<file>\n")
+                buf.write(b"<path>")
+                buf.write(file.encode("utf-8"))
+                buf.write(b"</path>\n")
                 if not file_content.strip():
-                    file_content = "EMPTY FILE"
-                prompt += f"<content>\n{file_content}\n</content>\n"
-                prompt += f"</file>\n\n"
-                
-            except UnicodeDecodeError:
-                print(f"Unable to decode file content due to UnicodeDecodeError: {file}")
-            except FileNotFoundError:
-                print(f"File not found: {file}")
+                    file_content = b"EMPTY FILE"
+                buf.write(b"<content>\n")
+                buf.write(file_content)
+                buf.write(b"\n</content>\n")
+                buf.write(b"</file>\n\n")
 
-    prompt += "</files>\n"
-    prompt += "</context>"
-    return prompt
+    buf.write(b"</files>\n")
+    buf.write(b"</context>")
+    if out is None:
+        return buf.getvalue()
+    return None
 
 
 def load_config(config_path: str) -> dict:
@@ -133,9 +434,10 @@ def load_config(config_path: str) -> dict:
         raise Exception(f"Config file not found: {config_path}")
     
 
-def save_file(contents: str, outpath: str = ".", outfile: str = "out"):
+def save_file(contents: bytes, outpath: str = ".", outfile: str = "out"):
     path = os.path.join(outpath, f"{outfile}.txt")
-    with open(path, "w") as f:
+    # the prompt is already UTF-8 bytes, so write it out binary with no encode pass
+    with open(path, "wb") as f:
         f.write(contents)
 
 
@@ -186,9 +488,9 @@ def parse_options():
     else:
         args.ignore_file.append(f"{args.outfile}.txt")
         
-    # set the default config file path 
+    # set the default config file path
     if args.config is None:
-        args.config = str(files("dir2prompt").joinpath("config.json"))
+        args.config = default_config_path()
     return args
 
 
@@ -205,10 +507,15 @@ def main():
     if args.ignore_file:
         IGNORE_FILES.extend(args.ignore_file)
 
-    prompt = build_prompt(dir=args.dir, filters=args.filters, IGNORE_DIRS=IGNORE_DIRS, IGNORE_FILES=IGNORE_FILES)
+    # compute the root directory's display name once instead of per tree build
+    base_name = os.path.basename(os.getcwd() if args.dir == "." else args.dir)
+
+    # open the output file up front and stream the prompt straight into it, so the
+    # full prompt is never buffered in memory
+    path = os.path.join(args.outpath, f"{args.outfile}.txt")
+    with open(path, "wb") as out:
+        build_prompt(dir=args.dir, filters=args.filters, IGNORE_DIRS=IGNORE_DIRS, IGNORE_FILES=IGNORE_FILES, out=out, base_name=base_name)
 
-    save_file(prompt, outpath=args.outpath, outfile=args.outfile)
-    
     print(f"Prompt saved to {os.path.join(args.outpath, args.outfile)}.txt")
 
 